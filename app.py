@@ -1,89 +1,313 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
+import io
 import os
+import sqlite3
 
 # ----------------- CONFIG -----------------
 st.set_page_config(page_title="Stationery Inventory", layout="wide")
 
-DATA_FILE = "stationery_inventory.csv"
+DATA_FILE = "stationery_inventory.db"
+# Data files written by earlier versions of the app, newest format first.
+LEGACY_DATA_FILES = ["stationery_inventory.parquet", "stationery_inventory.csv"]
+LEGACY_DEFAULTS = {
+    "item_name": "Unnamed item",
+    "category": "Uncategorized",
+    "unit": "Nos",
+    "location": "Not specified",
+}
+
+# Free-text columns are Arrow-backed strings: contiguous buffers compared
+# with Arrow kernels instead of per-element Python object comparisons.
+DTYPES = {
+    "item_id": "string[pyarrow]",
+    "item_name": "string[pyarrow]",
+    # Low-cardinality columns: categorical codes make isin() an int compare.
+    "category": "category",
+    "unit": "category",
+    "quantity": "Int64",
+    "reorder_level": "Int64",
+    "location": "category",
+    "last_updated": "string[pyarrow]",
+    "remarks": "string[pyarrow]",
+}
+COLUMNS = list(DTYPES)
 
 # ----------------- DATA LAYER -----------------
+@st.cache_resource
 def init_data_file():
-    """Create CSV with basic columns if not present."""
-    if not os.path.exists(DATA_FILE):
-        df = pd.DataFrame(
-            columns=[
-                "item_id",
-                "item_name",
-                "category",
-                "unit",
-                "quantity",
-                "reorder_level",
-                "location",
-                "last_updated",
-                "remarks",
-            ]
-        )
-        df.to_csv(DATA_FILE, index=False)
+    """Create the items and transactions tables if not present (once per process).
+
+    Returns an error message if the one-time legacy import failed, else None.
+    """
+    conn = sqlite3.connect(DATA_FILE)
+    try:
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    item_id TEXT PRIMARY KEY,
+                    item_name TEXT NOT NULL,
+                    category TEXT,
+                    unit TEXT,
+                    quantity INTEGER NOT NULL DEFAULT 0,
+                    reorder_level INTEGER NOT NULL DEFAULT 0,
+                    location TEXT,
+                    last_updated TEXT,
+                    remarks TEXT
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transactions (
+                    txn_id INTEGER PRIMARY KEY,
+                    ts TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    qty INTEGER NOT NULL,
+                    reason TEXT
+                )
+                """
+            )
+        # user_version marks the legacy import as done, so it never reruns
+        # once the items table has been emptied on purpose.
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            try:
+                with conn:
+                    import_legacy_data(conn)
+                    conn.execute("PRAGMA user_version = 1")
+            except Exception as exc:  # any unreadable legacy file; the app must still start
+                return f"Could not import the legacy inventory file: {exc}"
+    finally:
+        conn.close()
+    return None
+
+
+def import_legacy_data(conn: sqlite3.Connection):
+    """Copy the newest non-empty legacy data file into the items table if it is still empty."""
+    if conn.execute("SELECT 1 FROM items LIMIT 1").fetchone():
+        return
+    for path in LEGACY_DATA_FILES:
+        if os.path.exists(path):
+            df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+            df = df.reindex(columns=COLUMNS).dropna(subset=["item_id"])
+            if df.empty:
+                # Parquet-based versions created an empty file on startup
+                # without migrating the CSV, so fall through to the older format.
+                continue
+            df = df.drop_duplicates("item_id", keep="last")
+            # Same coercions the CSV-based versions applied on every load.
+            for col in ("quantity", "reorder_level"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+            # Same defaults the add/update forms apply to blank fields; the
+            # old files never enforced a name, but the items table does.
+            for col, default in LEGACY_DEFAULTS.items():
+                text = df[col].astype("string").str.strip()
+                df[col] = text.mask(text == "").fillna(default)
+            df.to_sql("items", conn, if_exists="append", index=False)
+            return
+
 
+@contextmanager
+def connect():
+    """Short-lived connection for one unit of work in the calling thread.
 
-def load_data():
+    Commits on success and rolls back on error, so sessions never share
+    transaction state. Caches are cleared after any committed write.
+    """
     init_data_file()
-    df = pd.read_csv(DATA_FILE)
-    # Ensure types
-    if "quantity" in df.columns:
-        df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0).astype(int)
-    if "reorder_level" in df.columns:
-        df["reorder_level"] = pd.to_numeric(df["reorder_level"], errors="coerce").fillna(0).astype(int)
-    return df
+    conn = sqlite3.connect(DATA_FILE)
+    try:
+        with conn:
+            yield conn
+        if conn.total_changes:
+            clear_caches()
+    finally:
+        conn.close()
+
+
+def data_mtime() -> float:
+    """Modification time of the data file, used as the cache key for reads."""
+    init_data_file()
+    return os.path.getmtime(DATA_FILE)
+
+
+@st.cache_data
+def load_data(mtime: float):
+    # `mtime` is only a cache key: an unchanged file is served from memory.
+    # Rows come back sorted by name once here, so renders never re-sort.
+    # Indexing by item_id turns row lookups into label lookups.
+    with connect() as conn:
+        df = pd.read_sql("SELECT * FROM items ORDER BY item_name, item_id", conn).astype(DTYPES)
+    # Remarks are optional; normalize NULLs once so readers never see NA.
+    df["remarks"] = df["remarks"].fillna("")
+    return df.set_index("item_id", drop=False)
+
+
+def session_data() -> pd.DataFrame:
+    """Inventory frame kept in session state, reloaded only when the data file changes."""
+    # st.cache_data hands out a fresh copy on every call; the session copy
+    # lets plain widget reruns skip even that.
+    mtime = data_mtime()
+    if "df" not in st.session_state or st.session_state.get("df_mtime") != mtime:
+        st.session_state["df"] = load_data(mtime)
+        st.session_state["df_mtime"] = mtime
+    return st.session_state["df"]
+
+
+def clear_caches():
+    load_data.clear()
+    filter_options.clear()
+    build_item_map.clear()
+    # Force this session to reload on its next run; other sessions notice the new mtime.
+    st.session_state.pop("df", None)
+    st.session_state.pop("df_mtime", None)
+
+
+def insert_row(conn: sqlite3.Connection, row: dict):
+    """Insert a single item without touching the other rows."""
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    conn.execute(
+        f"INSERT INTO items ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+        [row[c] for c in COLUMNS],
+    )
+
 
+def update_row(conn: sqlite3.Connection, item_id: str, **fields):
+    """Update the given columns of a single item with one UPDATE statement."""
+    assignments = ", ".join(f"{col} = ?" for col in fields)
+    conn.execute(
+        f"UPDATE items SET {assignments} WHERE item_id = ?",
+        [*fields.values(), item_id],
+    )
 
-def save_data(df: pd.DataFrame):
-    df.to_csv(DATA_FILE, index=False)
 
+def delete_row(conn: sqlite3.Connection, item_id: str):
+    """Delete a single item without touching the other rows."""
+    conn.execute("DELETE FROM items WHERE item_id = ?", (item_id,))
 
-def generate_item_id(df: pd.DataFrame) -> str:
-    """Simple incremental ID: STN-0001, STN-0002, ..."""
-    if df.empty:
-        return "STN-0001"
-    existing_ids = df["item_id"].dropna().tolist()
-    nums = []
-    for x in existing_ids:
-        try:
-            nums.append(int(str(x).split("-")[-1]))
-        except ValueError:
-            continue
-    next_num = max(nums) + 1 if nums else 1
+
+def append_txn(conn: sqlite3.Connection, item_id: str, kind: str, qty: int, reason: str, ts: str):
+    """Record one issue/receive event in the append-only transaction log."""
+    conn.execute(
+        "INSERT INTO transactions (ts, item_id, kind, qty, reason) VALUES (?, ?, ?, ?, ?)",
+        (ts, item_id, kind, qty, reason),
+    )
+
+
+def post_txn(conn: sqlite3.Connection, item_id: str, delta: int, kind: str, reason: str, ts: str) -> tuple:
+    """Apply a stock change and log it, both inside the caller's transaction.
+
+    The quantity is adjusted relative to the stored value, so concurrent posts
+    cannot overwrite each other, and an issue larger than the stock on hand
+    matches no row. Returns (posted, quantity): the new quantity when posted,
+    otherwise the current one (None if the item no longer exists).
+    """
+    cur = conn.execute(
+        "UPDATE items SET quantity = quantity + ?, last_updated = ? WHERE item_id = ? AND quantity + ? >= 0",
+        (delta, ts, item_id, delta),
+    )
+    posted = cur.rowcount == 1
+    if posted:
+        append_txn(conn, item_id, kind, abs(delta), reason, ts)
+    found = conn.execute("SELECT quantity FROM items WHERE item_id = ?", (item_id,)).fetchone()
+    return posted, found[0] if found else None
+
+
+def load_recent_txns(conn: sqlite3.Connection, limit: int = 200) -> pd.DataFrame:
+    """Most recent transactions first; only the requested rows are read."""
+    return pd.read_sql(
+        "SELECT ts, item_id, kind, qty, reason FROM transactions ORDER BY txn_id DESC LIMIT ?",
+        conn,
+        params=(limit,),
+    )
+
+
+@st.cache_data
+def filter_options(mtime: float) -> tuple:
+    """Sorted category and location options, cached alongside load_data."""
+    df = load_data(mtime)
+    # Categories inferred by astype("category") are already unique and sorted.
+    return df["category"].cat.categories.tolist(), df["location"].cat.categories.tolist()
+
+
+@st.cache_data
+def build_item_map(mtime: float) -> dict:
+    """Map "<item_id> - <item_name>" selectbox labels to item IDs."""
+    df = load_data(mtime)
+    labels = (df["item_id"].astype(str) + " - " + df["item_name"].astype(str)).tolist()
+    return dict(zip(labels, df["item_id"].tolist()))
+
+
+def generate_item_id(conn: sqlite3.Connection) -> str:
+    """Simple incremental ID: STN-0001, STN-0002, ...
+
+    IDs still referenced by the transaction log count as taken, so a deleted
+    item's number is never reused and its history cannot attach to a new item.
+    """
+    ids = pd.read_sql("SELECT item_id FROM items UNION SELECT item_id FROM transactions", conn)["item_id"]
+    nums = pd.to_numeric(
+        ids.dropna().astype(str).str.rsplit("-", n=1).str[-1],
+        errors="coerce",
+    )
+    next_num = int(nums.max()) + 1 if nums.notna().any() else 1
     return f"STN-{next_num:04d}"
 
 
 # ----------------- UI HELPERS -----------------
-def sidebar_filters(df: pd.DataFrame):
-    st.sidebar.subheader("Filters")
-    category_filter = st.sidebar.multiselect(
+def now_str() -> str:
+    """Current local time as "YYYY-MM-DD HH:MM:SS" for last_updated and the log."""
+    return datetime.now().isoformat(sep=" ", timespec="seconds")
+
+
+def clean_text(value: str, default: str = "") -> str:
+    """Strip a form value once, falling back to `default` when it is blank."""
+    return value.strip() or default
+
+
+def filter_controls():
+    # Rendered inline rather than in st.sidebar: widgets inside a fragment
+    # cannot be placed in containers outside it.
+    category_options, location_options = filter_options(data_mtime())
+    col1, col2, col3 = st.columns(3)
+    category_filter = col1.multiselect(
         "Category",
-        options=sorted(df["category"].dropna().unique().tolist()),
+        options=category_options,
         default=None,
     )
-    location_filter = st.sidebar.multiselect(
+    location_filter = col2.multiselect(
         "Location",
-        options=sorted(df["location"].dropna().unique().tolist()),
+        options=location_options,
         default=None,
     )
-    low_stock_only = st.sidebar.checkbox("Show only low stock items (qty ≤ reorder level)", value=False)
+    low_stock_only = col3.checkbox("Show only low stock items (qty ≤ reorder level)", value=False)
 
     return category_filter, location_filter, low_stock_only
 
 
-def apply_filters(df, category_filter, location_filter, low_stock_only):
+def low_stock_mask(df: pd.DataFrame) -> np.ndarray:
+    """Boolean array of rows with qty ≤ reorder level, compared without index alignment."""
+    qty = df["quantity"].to_numpy(dtype="int64", na_value=0)
+    ror = df["reorder_level"].to_numpy(dtype="int64", na_value=0)
+    return qty <= ror
+
+
+def apply_filters(df, category_filter, location_filter, low_stock_only, low_mask=None):
+    """Filter with one combined mask; `low_mask` reuses a precomputed low_stock_mask(df)."""
+    if not (category_filter or location_filter or low_stock_only):
+        return df
+    mask = np.ones(len(df), dtype=bool)
     if category_filter:
-        df = df[df["category"].isin(category_filter)]
+        mask &= df["category"].isin(category_filter).to_numpy()
     if location_filter:
-        df = df[df["location"].isin(location_filter)]
+        mask &= df["location"].isin(location_filter).to_numpy()
     if low_stock_only:
-        df = df[df["quantity"] <= df["reorder_level"]]
-    return df
+        mask &= low_stock_mask(df) if low_mask is None else low_mask
+    return df[mask]
 
 
 # ----------------- PAGES -----------------
@@ -91,8 +315,9 @@ def page_dashboard(df: pd.DataFrame):
     st.header("Stationery Inventory Dashboard")
 
     total_items = len(df)
-    total_qty = int(df["quantity"].sum()) if not df.empty else 0
-    low_stock_count = int((df["quantity"] <= df["reorder_level"]).sum()) if not df.empty else 0
+    low_mask = low_stock_mask(df)
+    total_qty = int(df["quantity"].to_numpy(dtype="int64", na_value=0).sum())
+    low_stock_count = int(low_mask.sum())
 
     col1, col2, col3 = st.columns(3)
     col1.metric("Distinct items", total_items)
@@ -100,17 +325,24 @@ def page_dashboard(df: pd.DataFrame):
     col3.metric("Low-stock items", low_stock_count)
 
     st.markdown("---")
+    inventory_table(df, low_mask)
+
+
+@st.fragment
+def inventory_table(df: pd.DataFrame, low_mask: np.ndarray):
+    """Filters and filtered list; changing a filter reruns only this fragment."""
     st.subheader("Current inventory list")
 
-    category_filter, location_filter, low_stock_only = sidebar_filters(df)
-    filtered_df = apply_filters(df.copy(), category_filter, location_filter, low_stock_only)
+    category_filter, location_filter, low_stock_only = filter_controls()
+    filtered_df = apply_filters(df, category_filter, location_filter, low_stock_only, low_mask)
 
     if filtered_df.empty:
         st.info("No items match current filters.")
     else:
         st.dataframe(
-            filtered_df.sort_values("item_name"),
+            filtered_df,
             use_container_width=True,
+            hide_index=True,
         )
 
 
@@ -137,38 +369,41 @@ def page_add_edit(df: pd.DataFrame):
             submitted = st.form_submit_button("Add item")
 
             if submitted:
-                if not item_name.strip():
+                name = clean_text(item_name)
+                if not name:
                     st.error("Item name is required.")
                     return
 
-                new_id = generate_item_id(df)
-                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                now = now_str()
 
                 new_row = {
-                    "item_id": new_id,
-                    "item_name": item_name.strip(),
-                    "category": category.strip() or "Uncategorized",
-                    "unit": unit.strip() or "Nos",
+                    "item_name": name,
+                    "category": clean_text(category, "Uncategorized"),
+                    "unit": clean_text(unit, "Nos"),
                     "quantity": int(quantity),
                     "reorder_level": int(reorder_level),
-                    "location": location.strip() or "Not specified",
+                    "location": clean_text(location, "Not specified"),
                     "last_updated": now,
-                    "remarks": remarks.strip(),
+                    "remarks": clean_text(remarks),
                 }
 
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                save_data(df)
+                with connect() as conn:
+                    # Take the write lock before reading the last ID, so two
+                    # sessions adding at once cannot pick the same one.
+                    conn.execute("BEGIN IMMEDIATE")
+                    new_id = generate_item_id(conn)
+                    insert_row(conn, {"item_id": new_id, **new_row})
                 st.success(f"Item added with ID {new_id}.")
     else:
         if df.empty:
             st.info("No items to update. Add items first.")
             return
 
-        item_map = {f"{row.item_id} - {row.item_name}": row.item_id for _, row in df.iterrows()}
+        item_map = build_item_map(data_mtime())
         selected = st.selectbox("Select item to update", options=list(item_map.keys()))
         selected_id = item_map[selected]
 
-        row = df[df["item_id"] == selected_id].iloc[0]
+        row = df.loc[selected_id]
 
         with st.form("update_item_form"):
             col1, col2 = st.columns(2)
@@ -187,26 +422,28 @@ def page_add_edit(df: pd.DataFrame):
                     step=1,
                     value=int(row.get("reorder_level", 0)),
                 )
-                remarks = st.text_area("Remarks", value=row.get("remarks", ""))
+                remarks = st.text_area("Remarks", value=row["remarks"])
 
             submitted = st.form_submit_button("Update item")
 
             if submitted:
-                if not item_name.strip():
+                name = clean_text(item_name)
+                if not name:
                     st.error("Item name is required.")
                     return
 
-                idx = df.index[df["item_id"] == selected_id][0]
-                df.at[idx, "item_name"] = item_name.strip()
-                df.at[idx, "category"] = category.strip() or "Uncategorized"
-                df.at[idx, "unit"] = unit.strip() or "Nos"
-                df.at[idx, "location"] = location.strip() or "Not specified"
-                df.at[idx, "quantity"] = int(quantity)
-                df.at[idx, "reorder_level"] = int(reorder_level)
-                df.at[idx, "remarks"] = remarks.strip()
-                df.at[idx, "last_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                save_data(df)
+                updates = {
+                    "item_name": name,
+                    "category": clean_text(category, "Uncategorized"),
+                    "unit": clean_text(unit, "Nos"),
+                    "location": clean_text(location, "Not specified"),
+                    "quantity": int(quantity),
+                    "reorder_level": int(reorder_level),
+                    "remarks": clean_text(remarks),
+                    "last_updated": now_str(),
+                }
+                with connect() as conn:
+                    update_row(conn, selected_id, **updates)
                 st.success(f"Item {selected_id} updated.")
 
 
@@ -217,11 +454,11 @@ def page_issue_receive(df: pd.DataFrame):
         st.info("No items in inventory. Add items first.")
         return
 
-    item_map = {f"{row.item_id} - {row.item_name}": row.item_id for _, row in df.iterrows()}
+    item_map = build_item_map(data_mtime())
     selected = st.selectbox("Select item", options=list(item_map.keys()))
     selected_id = item_map[selected]
 
-    row = df[df["item_id"] == selected_id].iloc[0]
+    row = df.loc[selected_id]
 
     st.write(f"Current quantity: **{int(row['quantity'])} {row.get('unit', 'Nos')}**")
     st.write(f"Reorder level: **{int(row['reorder_level'])}**")
@@ -234,28 +471,20 @@ def page_issue_receive(df: pd.DataFrame):
         submitted = st.form_submit_button("Post transaction")
 
         if submitted:
-            idx = df.index[df["item_id"] == selected_id][0]
-            current_qty = int(df.at[idx, "quantity"])
+            kind = mode.split()[0]
+            delta = -int(qty) if mode.startswith("Issue") else int(qty)
 
-            if mode.startswith("Issue"):
-                if qty > current_qty:
-                    st.error(f"Cannot issue {qty}; only {current_qty} available.")
-                    return
-                new_qty = current_qty - qty
-            else:
-                new_qty = current_qty + qty
-
-            df.at[idx, "quantity"] = int(new_qty)
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            df.at[idx, "last_updated"] = now
+            with connect() as conn:
+                posted, quantity = post_txn(conn, selected_id, delta, kind, clean_text(reason), now_str())
 
-            # Append transaction info to remarks (simple audit trail)
-            old_remarks = str(df.at[idx, "remarks"]) if not pd.isna(df.at[idx, "remarks"]) else ""
-            line = f"[{now}] {mode.split()[0]} {int(qty)} ({reason})"
-            df.at[idx, "remarks"] = (old_remarks + " | " + line).strip(" |")
+            if quantity is None:
+                st.error(f"Item {selected_id} no longer exists.")
+                return
+            if not posted:
+                st.error(f"Cannot issue {qty}; only {quantity} available.")
+                return
 
-            save_data(df)
-            st.success(f"{mode.split()[0]}d {int(qty)} units. New quantity: {new_qty}.")
+            st.success(f"{kind}d {int(qty)} units. New quantity: {quantity}.")
 
 
 def page_admin(df: pd.DataFrame):
@@ -267,32 +496,54 @@ def page_admin(df: pd.DataFrame):
 
     st.warning("Deleting items is permanent. Export data first if needed.")
 
+    # Encode straight into a bytes buffer instead of building a str first.
+    # chunksize only batches row formatting; the full CSV still ends up in buf.
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding="utf-8", chunksize=10_000)
+    buf.seek(0)
     st.download_button(
         "Download full inventory as CSV",
-        data=df.to_csv(index=False),
+        data=buf,
         file_name=f"stationery_inventory_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
         mime="text/csv",
     )
 
-    item_map = {f"{row.item_id} - {row.item_name}": row.item_id for _, row in df.iterrows()}
+    item_map = build_item_map(data_mtime())
     selected = st.selectbox("Select item to delete", options=list(item_map.keys()))
     selected_id = item_map[selected]
 
     if st.button("Delete selected item"):
-        df_new = df[df["item_id"] != selected_id].reset_index(drop=True)
-        save_data(df_new)
+        with connect() as conn:
+            delete_row(conn, selected_id)
         st.success(f"Item {selected_id} deleted. Reload page to see updated list.")
 
 
+def page_transactions():
+    st.header("Transaction Log")
+
+    with connect() as conn:
+        txns = load_recent_txns(conn)
+    if txns.empty:
+        st.info("No transactions posted yet.")
+        return
+
+    st.caption(f"Showing the latest {len(txns)} transactions.")
+    st.dataframe(txns, use_container_width=True, hide_index=True)
+
+
 # ----------------- MAIN APP -----------------
 def main():
     st.title("Stationery Inventory Management")
 
-    df = load_data()
+    import_error = init_data_file()
+    if import_error:
+        st.error(import_error)
+
+    df = session_data()
 
     menu = st.sidebar.radio(
         "Navigation",
-        ["Dashboard", "Add / Update Item", "Issue / Receive", "Admin"],
+        ["Dashboard", "Add / Update Item", "Issue / Receive", "Transactions", "Admin"],
     )
 
     if menu == "Dashboard":
@@ -301,6 +552,8 @@ def main():
         page_add_edit(df)
     elif menu == "Issue / Receive":
         page_issue_receive(df)
+    elif menu == "Transactions":
+        page_transactions()
     elif menu == "Admin":
         page_admin(df)
 